@@ -0,0 +1,80 @@
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow é opcional; sem ele as datas são lidas pelo pandas
+    pa = None
+
+# Chave de acesso da NF-e tem 44 dígitos; como número perderia precisão
+ARROW_TEXT_COLUMNS = ('CHAVE DE ACESSO',)
+
+# Formato das datas de emissão nos CSVs de NF-e
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Mantém dtypes Arrow após a leitura (alguns não são aceitos pelo Excel)
+USE_ARROW_DTYPES = False
+
+
+def is_money_column(col):
+    """Colunas monetárias ficam em float64: em float32 R$100,10 vira 100.099998"""
+    return str(col).upper().startswith('VALOR')
+
+
+def normalize_question(question):
+    """Normaliza a pergunta: minúsculas, sem acentos e espaços repetidos"""
+    text = unicodedata.normalize('NFKD', question).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def weighted_mean(column_stats):
+    """Média dos valores a partir das somas e contagens de cada arquivo (None se não houver)"""
+    stats = [s for s in column_stats.values() if 'valor_sum' in s]
+    if not stats:
+        return None
+    count = sum(s['valor_count'] for s in stats)
+    return sum(s['valor_sum'] for s in stats) / count if count else float('nan')
+
+
+def to_timestamp(serie):
+    """Converte texto em timestamp, via pyarrow quando disponível"""
+    if pa is not None:
+        try:
+            parsed = pc.strptime(
+                pa.array(serie, type=pa.string(), from_pandas=True), format=DATE_FORMAT, unit='ns'
+            )
+            return pd.Series(parsed.to_numpy(zero_copy_only=False), index=serie.index, name=serie.name)
+        except (pa.ArrowException, TypeError):
+            pass
+    return pd.to_datetime(serie, format='ISO8601', errors='coerce')
+
+
+def _parse_text_dates(serie):
+    """Lê datas em texto: ISO primeiro, o que sobrar como dia/mês/ano"""
+    parsed = pd.to_datetime(serie, format='ISO8601', errors='coerce')
+    rest = parsed.isna() & serie.notna()
+    if rest.any():
+        parsed[rest] = pd.to_datetime(serie[rest], dayfirst=True, errors='coerce')
+    return parsed
+
+
+def parse_date_column(serie):
+    """Converte a coluna só se nenhum valor se perder; tenta ISO e depois dia/mês/ano"""
+    missing = serie.isna().sum()
+    parsed = to_timestamp(serie)
+    if parsed.isna().sum() == missing:
+        return parsed
+    parsed = _parse_text_dates(serie)
+    if parsed.isna().sum() == missing:
+        return parsed
+    return None
+
+
+def date_values(serie):
+    """Datas como datetime64; colunas mantidas como texto na carga são lidas aqui"""
+    if not pd.api.types.is_datetime64_any_dtype(serie):
+        serie = _parse_text_dates(serie)
+    return serie.to_numpy(dtype='datetime64[ns]')
@@ -0,0 +1,47 @@
+import numpy as np
+
+try:
+    from numba import njit, prange, get_num_threads
+except ImportError:  # numba é opcional; sem ele usa-se np.bincount
+    njit = None
+
+
+def _grouped_sum_numpy(codes, vals, n_groups):
+    """Soma valores por grupo ignorando códigos -1 e valores NaN"""
+    mask = (codes >= 0) & ~np.isnan(vals)
+    return np.bincount(codes[mask], weights=vals[mask], minlength=n_groups)
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _grouped_sum_kernel(codes, vals, n_groups, n_threads):
+        """Soma valores por grupo em paralelo, com parciais por thread"""
+        partials = np.zeros((n_threads, n_groups))
+        chunk = (len(codes) + n_threads - 1) // n_threads
+        for t in prange(n_threads):
+            for i in range(t * chunk, min((t + 1) * chunk, len(codes))):
+                code = codes[i]
+                value = vals[i]
+                if code >= 0 and not np.isnan(value):
+                    partials[t, code] += value
+        out = np.zeros(n_groups)
+        for t in range(n_threads):
+            for g in range(n_groups):
+                out[g] += partials[t, g]
+        return out
+
+    def grouped_sum(codes, vals, n_groups):
+        """Soma valores por grupo usando o kernel compilado"""
+        return _grouped_sum_kernel(codes, vals, n_groups, get_num_threads())
+else:
+    grouped_sum = _grouped_sum_numpy
+
+
+def top_k_indices(totals, k):
+    """Retorna os índices dos k maiores totais, em ordem decrescente"""
+    k = min(k, len(totals))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    # Seleção parcial O(N) em vez de ordenar todos os totais
+    idx = np.argpartition(-totals, k - 1)[:k]
+    return idx[np.argsort(-totals[idx], kind='stable')]
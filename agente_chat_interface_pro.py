@@ -1,10 +1,13 @@
 import pandas as pd
 import zipfile
 import os
+import io
 from dotenv import load_dotenv
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, filedialog, ttk
 import threading
+import codecs
+from collections import OrderedDict
 from openai import OpenAI
 from datetime import datetime
 import chardet
@@ -13,6 +16,58 @@ import logging
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
 from pandastable import Table
+from _kernels import grouped_sum, top_k_indices
+from _common import (
+    ARROW_TEXT_COLUMNS, USE_ARROW_DTYPES, date_values, is_money_column, normalize_question,
+    parse_date_column, weighted_mean
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # pyarrow é opcional; sem ele usa-se o leitor do pandas
+    pa = None
+    pacsv = None
+
+try:
+    import cchardet as chardet_fast
+except ImportError:
+    chardet_fast = None
+
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
+
+# BOMs que definem a codificação sem precisar de detecção estatística
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+ENCODING_SAMPLE_SIZE = 2048
+ENCODING_CACHE_SIZE = 64
+# Total de linhas de amostra enviadas à API, somando todos os arquivos
+PROMPT_SAMPLE_ROWS = 200
+# Colunas de NF-e relevantes para o especialista; as demais só aumentam o prompt
+PROMPT_COLUMNS = ('fornecedor', 'valor', 'data', 'cnpj')
+# Acima disso o histograma usa amostra; o formato da distribuição não muda
+MAX_HIST_POINTS = 100_000
+# Arquivos maiores têm describe() calculado sobre amostra deste tamanho
+MAX_DESCRIBE_ROWS = 200_000
+
+# Instruções fixas enviadas antes dos dados e da pergunta, para que o
+# prefixo do prompt seja idêntico entre chamadas e aproveite o cache da API
+FIXED_INSTRUCTIONS = (
+    "Você é um analista especialista em notas fiscais brasileiras (NF-e). "
+    "Analise os dados e responda de forma técnica e precisa.\n\n"
+    "Inclua insights relevantes sobre:"
+    "\n- Relação entre fornecedores e valores"
+    "\n- Padrões temporais"
+    "\n- Anomalias potenciais"
+    "\n- Conformidade com legislação brasileira"
+)
+
 
 # Configuração de logging
 logging.basicConfig(
@@ -30,7 +85,19 @@ class NFExpertGUI:
         self.dataframes = {}
         self.current_file = None
         self.client = None
+        self._client_lock = threading.Lock()
         self.column_stats = {}
+        self._combined_df = None
+        self._combined_dirty = True
+        self._prompt_sample = None
+        self._supplier_totals = None
+        self._dataset_version = 0
+        self._answer_cache = {}
+        self._encoding_cache = OrderedDict()
+        self._encoding_lock = threading.Lock()
+        # Evento de cancelamento da consulta à API em andamento (None quando não há)
+        self._cancel_event = None
+        self.use_arrow_dtypes = USE_ARROW_DTYPES
         self.setup_ui()
         self.load_config()
         self.setup_analytics()
@@ -151,7 +218,7 @@ class NFExpertGUI:
         ]
         
         for text, cmd in buttons:
-            ttk.Button(analysis_frame, text=text, command=cmd).pack(fill=tk.X, pady=2)
+            ttk.Button(analysis_frame, text=text, command=lambda fn=cmd: self.run_analysis(fn)).pack(fill=tk.X, pady=2)
         
     def setup_chat_panel(self, parent):
         """Painel de interação por chat"""
@@ -179,6 +246,7 @@ class NFExpertGUI:
         self.user_input.bind('<Return>', lambda e: self.send_question())
         
         ttk.Button(input_frame, text="Enviar", command=self.send_question).pack(side=tk.RIGHT)
+        ttk.Button(input_frame, text="Cancelar", command=self.cancel_question).pack(side=tk.RIGHT, padx=2)
         
     def setup_visualization_panel(self, parent):
         """Painel de visualização gráfica"""
@@ -195,6 +263,10 @@ class NFExpertGUI:
         
         # Canvas para matplotlib
         self.figure = plt.Figure(figsize=(6, 4), dpi=100)
+        # Eixos criados uma vez e reaproveitados a cada seleção de arquivo
+        self.ax1, self.ax2 = self.figure.subplots(2, 1)
+        self.ax1.set_visible(False)
+        self.ax2.set_visible(False)
         self.canvas = FigureCanvasTkAgg(self.figure, master=self.plot_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
@@ -205,11 +277,17 @@ class NFExpertGUI:
             self.api_key = os.getenv("OPENAI_API_KEY")
             if not self.api_key:
                 raise ValueError("OPENAI_API_KEY não encontrada no .env")
-            self.client = OpenAI(api_key=self.api_key)
         except Exception as e:
             messagebox.showerror("Erro de Configuração", f"Falha na configuração: {str(e)}")
             self.root.quit()
     
+    def get_client(self):
+        """Cria o cliente OpenAI na primeira consulta, não na abertura da janela"""
+        with self._client_lock:
+            if self.client is None:
+                self.client = OpenAI(api_key=self.api_key)
+            return self.client
+    
     def setup_analytics(self):
         """Configura perguntas e análises pré-definidas"""
         self.predefined_questions = {
@@ -219,6 +297,11 @@ class NFExpertGUI:
             'Top 3 Fornecedores': "Quais são os 3 fornecedores com maior valor total?",
             'Distribuição Temporal': "Qual é a distribuição temporal das notas fiscais?"
         }
+        # Chave e texto de cada pergunta, normalizados, apontam para a mesma análise
+        self._question_index = {}
+        for q_text, q_content in self.predefined_questions.items():
+            self._question_index[normalize_question(q_text)] = q_text
+            self._question_index[normalize_question(q_content)] = q_text
     
     def show_welcome_message(self):
         """Exibe mensagem de boas-vindas"""
@@ -247,25 +330,53 @@ Dica: Você pode arrastar e soltar arquivos na janela!
             if not file_path:
                 return
         
+        self.status_var.set("🔄 Carregando arquivo...")
+        
+        # Leitura em segundo plano para não congelar a interface
+        threading.Thread(
+            target=self._load_file_worker,
+            args=(file_path,),
+            daemon=True
+        ).start()
+    
+    def _load_file_worker(self, file_path):
+        """Lê e prepara o arquivo fora da thread da interface"""
         try:
-            self.status_var.set("🔄 Carregando arquivo...")
-            self.root.update()
-            
-            temp_dir = None
             if file_path.endswith('.zip'):
-                temp_dir = self._extract_zip(file_path)
-                csv_files = [f for f in os.listdir(temp_dir) if f.endswith('.csv')]
-                if not csv_files:
-                    messagebox.showerror("Erro", "Nenhum arquivo CSV encontrado no ZIP")
-                    return
-                file_path = os.path.join(temp_dir, csv_files[0])
+                # Lê o CSV direto do ZIP, sem extrair para o disco
+                with zipfile.ZipFile(file_path, 'r') as zip_ref:
+                    # Para no primeiro CSV, sem montar a lista completa
+                    info = next((i for i in zip_ref.infolist() if i.filename.endswith('.csv')), None)
+                    if info is None:
+                        self.root.after(0, self._on_load_error, "Nenhum arquivo CSV encontrado no ZIP")
+                        return
+                    with zip_ref.open(info) as member:
+                        raw = member.read()
+                    size = info.file_size
+                filename = os.path.basename(info.filename)
+                encoding = self._sniff_encoding(raw[:ENCODING_SAMPLE_SIZE])
+                source = io.BytesIO(raw)
+            else:
+                filename = os.path.basename(file_path)
+                encoding = self.detect_encoding(file_path)
+                source = file_path
+                size = os.path.getsize(file_path)
             
-            encoding = self.detect_encoding(file_path)
-            df = self._read_csv_with_fallback(file_path, encoding)
+            df = self._read_csv_with_fallback(source, encoding)
+            stats = self._compute_column_stats(filename, df)
+            stats['bytes'] = size
+            self.root.after(0, self._on_file_loaded, filename, df, stats)
             
-            filename = os.path.basename(file_path)
+        except Exception as e:
+            logging.error(f"Erro ao carregar arquivo: {str(e)}")
+            self.root.after(0, self._on_load_error, f"Falha ao carregar arquivo:\n{str(e)}")
+    
+    def _on_file_loaded(self, filename, df, stats):
+        """Registra o arquivo lido, já na thread da interface"""
+        try:
             self.dataframes[filename] = df
-            self._update_column_stats(filename, df)
+            self.column_stats[filename] = stats
+            self._invalidate_caches()
             
             if not self.current_file:
                 self.current_file = filename
@@ -278,54 +389,222 @@ Dica: Você pode arrastar e soltar arquivos na janela!
             messagebox.showerror("Erro", f"Falha ao carregar arquivo:\n{str(e)}")
             logging.error(f"Erro ao carregar arquivo: {str(e)}")
         finally:
-            if temp_dir and os.path.exists(temp_dir):
-                self._cleanup_temp_dir(temp_dir)
             self.status_var.set("🟢 Pronto")
     
-    def _extract_zip(self, zip_path):
-        """Extrai arquivo ZIP para diretório temporário"""
-        extract_path = f"temp_extract_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        os.makedirs(extract_path, exist_ok=True)
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_path)
-        return extract_path
+    def _on_load_error(self, message):
+        """Exibe falha de carregamento, já na thread da interface"""
+        messagebox.showerror("Erro", message)
+        self.status_var.set("🟢 Pronto")
     
     def detect_encoding(self, file_path):
         """Detecta a codificação do arquivo"""
+        stat = os.stat(file_path)
+        key = (file_path, stat.st_mtime_ns, stat.st_size)
+        with self._encoding_lock:
+            if key in self._encoding_cache:
+                self._encoding_cache.move_to_end(key)
+                return self._encoding_cache[key]
+        
         with open(file_path, 'rb') as f:
-            result = chardet.detect(f.read(10000))
-        return result['encoding']
+            encoding = self._sniff_encoding(f.read(ENCODING_SAMPLE_SIZE))
+        
+        with self._encoding_lock:
+            self._encoding_cache[key] = encoding
+            if len(self._encoding_cache) > ENCODING_CACHE_SIZE:
+                self._encoding_cache.popitem(last=False)
+        return encoding
+    
+    def _sniff_encoding(self, sample):
+        """Identifica a codificação pelo BOM ou por uma amostra dos bytes"""
+        for bom, encoding in BOMS:
+            if sample.startswith(bom):
+                return encoding
+        
+        if chardet_fast is not None:
+            encoding = chardet_fast.detect(sample)['encoding']
+        elif charset_normalizer is not None:
+            best = charset_normalizer.from_bytes(sample).best()
+            encoding = best.encoding if best else None
+        else:
+            encoding = chardet.detect(sample)['encoding']
+        
+        # Amostra só com ASCII não diz nada sobre o resto do arquivo; UTF-8 é o superconjunto
+        if encoding is None or encoding.lower() == 'ascii':
+            return 'utf-8'
+        return encoding
     
     def _read_csv_with_fallback(self, file_path, encoding):
         """Tenta ler CSV com diferentes abordagens"""
+        # A detecção usa só o início do arquivo; se errar, tenta UTF-8 e depois as latinas
+        encodings = list(dict.fromkeys([encoding or 'utf-8', 'utf-8', 'cp1252', 'latin-1']))
+        for enc in encodings[:-1]:
+            try:
+                return self._read_csv_with_encoding(file_path, enc)
+            except UnicodeDecodeError as e:
+                logging.warning(f"Falha ao decodificar CSV como {enc}, tentando outra codificação: {str(e)}")
+        return self._read_csv_with_encoding(file_path, encodings[-1])
+    
+    def _read_csv_with_encoding(self, file_path, encoding):
+        """Lê o CSV com uma codificação: pyarrow primeiro, pandas em seguida"""
+        if pacsv is not None:
+            try:
+                self._rewind(file_path)
+                table = pacsv.read_csv(
+                    file_path,
+                    read_options=pacsv.ReadOptions(
+                        encoding=encoding, use_threads=True, block_size=8 << 20
+                    ),
+                    convert_options=pacsv.ConvertOptions(
+                        column_types={col: pa.string() for col in ARROW_TEXT_COLUMNS},
+                        strings_can_be_null=True
+                    )
+                )
+                # Bytes inválidos para a codificação viram colunas binárias; o pandas acusa o erro
+                if not any(pa.types.is_binary(field.type) for field in table.schema):
+                    return table.to_pandas(types_mapper=pd.ArrowDtype if self.use_arrow_dtypes else None)
+            except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+                logging.warning(f"Falha ao ler CSV com pyarrow, usando pandas: {str(e)}")
+        
+        read_kwargs = {'dtype_backend': 'pyarrow'} if self.use_arrow_dtypes else {}
         try:
-            return pd.read_csv(file_path, encoding=encoding, low_memory=False)
-        except Exception as e:
+            self._rewind(file_path)
+            return pd.read_csv(file_path, encoding=encoding, engine='c', low_memory=False, **read_kwargs)
+        except pd.errors.ParserError as e:
             logging.warning(f"Falha ao ler CSV, tentando abordagem alternativa: {str(e)}")
-            return pd.read_csv(file_path, encoding=encoding, error_bad_lines=False)
+            self._rewind(file_path)
+            return pd.read_csv(
+                file_path, encoding=encoding, engine='c', low_memory=False,
+                on_bad_lines='skip', **read_kwargs
+            )
     
-    def _cleanup_temp_dir(self, temp_dir):
-        """Remove diretório temporário"""
-        for f in os.listdir(temp_dir):
-            os.remove(os.path.join(temp_dir, f))
-        os.rmdir(temp_dir)
+    def _rewind(self, source):
+        """Volta ao início de um buffer em memória antes de nova leitura"""
+        if isinstance(source, io.BytesIO):
+            source.seek(0)
     
-    def _update_column_stats(self, filename, df):
-        """Atualiza estatísticas das colunas"""
-        self.column_stats[filename] = {
+    def _compute_column_stats(self, filename, df):
+        """Calcula estatísticas das colunas (executa fora da thread da interface)"""
+        # Converte datas uma única vez, mas só se nenhum valor se perder
+        if 'data' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['data']):
+            parsed = parse_date_column(df['data'])
+            if parsed is not None:
+                df['data'] = parsed
+        
+        # Fornecedores se repetem muito; como categoria o agrupamento reusa os códigos
+        if 'fornecedor' in df.columns:
+            df['fornecedor'] = df['fornecedor'].astype('category')
+        
+        # Agregados pré-calculados para evitar reagrupar todos os dados a cada análise,
+        # feitos antes da redução de precisão abaixo
+        # Só com 'valor' numérico: texto como "1.234,56" seria concatenado, não somado
+        stats = {}
+        if 'valor' in df.columns and pd.api.types.is_numeric_dtype(df['valor']):
+            stats['valor_sum'] = df['valor'].sum()
+            stats['valor_count'] = df['valor'].count()
+            if 'fornecedor' in df.columns:
+                codes, uniques = pd.factorize(df['fornecedor'], sort=False)
+                valores = df['valor'].to_numpy(dtype=np.float64, na_value=np.nan)
+                stats['supplier_sum'] = pd.Series(
+                    grouped_sum(codes, valores, len(uniques)),
+                    index=pd.Index(uniques, name='fornecedor'), name='valor'
+                )
+        
+        # Reduz colunas numéricas ao menor tipo que comporta os valores
+        for col in df.select_dtypes(include=np.number).columns:
+            dtype = df[col].dtype
+            if dtype == np.float64 and not is_money_column(col):
+                df[col] = pd.to_numeric(df[col], downcast='float')
+            elif isinstance(dtype, np.dtype) and np.issubdtype(dtype, np.integer):
+                df[col] = pd.to_numeric(df[col], downcast='integer')
+        
+        stats.update({
             'numeric_cols': df.select_dtypes(include=np.number).columns.tolist(),
-            'text_cols': df.select_dtypes(include='object').columns.tolist(),
+            'text_cols': df.select_dtypes(include=['object', 'category']).columns.tolist(),
             'date_cols': df.select_dtypes(include='datetime').columns.tolist(),
             'shape': df.shape
-        }
+        })
+        
+        sample = df if len(df) <= MAX_DESCRIBE_ROWS else df.sample(MAX_DESCRIBE_ROWS, random_state=0)
+        stats['describe_str'] = sample.describe(percentiles=[0.25, 0.5, 0.75]).to_string()
+        
+        # Texto de metadados pronto para exibição ao selecionar o arquivo
+        stats['metadata_text'] = f"""=== METADADOS DO ARQUIVO ===
+Arquivo: {filename}
+Registros: {len(df):,}
+Colunas: {len(df.columns)}
+
+=== TIPOS DE DADOS ===
+{df.dtypes.to_string()}
+
+=== COLUNAS NUMÉRICAS ===
+{', '.join(stats['numeric_cols'])}
+
+=== COLUNAS DE TEXTO ===
+{', '.join(stats['text_cols'])}
+
+=== ESTATÍSTICAS ===
+{stats['describe_str']}
+"""
+        
+        return stats
+    
+    def _invalidate_caches(self):
+        """Descarta resultados derivados após mudança nos arquivos carregados"""
+        self._combined_dirty = True
+        self._prompt_sample = None
+        self._supplier_totals = None
+        self._dataset_version += 1
+        self._answer_cache.clear()
+    
+    def _get_combined(self):
+        """Retorna todos os dataframes combinados, reaproveitando o cache"""
+        if self._combined_dirty or self._combined_df is None:
+            self._combined_df = pd.concat(self.dataframes.values(), ignore_index=True)
+            self._combined_dirty = False
+        return self._combined_df
+    
+    def _get_supplier_totals(self):
+        """Retorna nomes e totais por fornecedor de todos os arquivos, reaproveitando o cache"""
+        if self._supplier_totals is None:
+            supplier_sums = [
+                stats['supplier_sum'] for stats in self.column_stats.values()
+                if 'supplier_sum' in stats
+            ]
+            if not supplier_sums:
+                return None
+            
+            merged = pd.concat(supplier_sums)
+            codes, names = pd.factorize(merged.index, sort=False)
+            totals = grouped_sum(codes, merged.to_numpy(dtype=np.float64), len(names))
+            self._supplier_totals = (names, totals)
+        return self._supplier_totals
+    
+    def _get_prompt_sample(self):
+        """Retorna amostra dos dados em CSV para o prompt, reaproveitando o cache"""
+        if self._prompt_sample is None:
+            per_df = max(10, PROMPT_SAMPLE_ROWS // len(self.dataframes))
+            samples = []
+            for df in self.dataframes.values():
+                columns = [c for c in PROMPT_COLUMNS if c in df.columns] or list(df.columns)
+                samples.append(df[columns].sample(min(per_df, len(df)), random_state=0))
+            sample = pd.concat(samples)
+            self._prompt_sample = sample.to_csv(index=False, lineterminator='\n')
+        return self._prompt_sample
     
     def update_file_list(self):
         """Atualiza a lista de arquivos na interface"""
-        self.file_tree.delete(*self.file_tree.get_children())
+        # Atualiza as linhas existentes no lugar, usando o nome do arquivo como id
+        existing = set(self.file_tree.get_children())
+        for item in existing - set(self.dataframes):
+            self.file_tree.delete(item)
+        
         for filename, df in self.dataframes.items():
-            self.file_tree.insert('', 'end', text=filename, 
-                                 values=(f"{os.path.getsize(filename)/1024:.1f} KB" if os.path.exists(filename) else 'N/A',
-                                 len(df), len(df.columns)))
+            size = self.column_stats[filename].get('bytes')
+            values = (f"{size/1024:.1f} KB" if size is not None else 'N/A', len(df), len(df.columns))
+            if filename in existing:
+                self.file_tree.item(filename, values=values)
+            else:
+                self.file_tree.insert('', 'end', iid=filename, text=filename, values=values)
     
     def select_file(self, event):
         """Seleciona arquivo para visualização"""
@@ -349,25 +628,7 @@ Dica: Você pode arrastar e soltar arquivos na janela!
             # Atualiza metadados
             self.metadata_text.config(state=tk.NORMAL)
             self.metadata_text.delete(1.0, tk.END)
-            
-            metadata = f"""=== METADADOS DO ARQUIVO ===
-Arquivo: {self.current_file}
-Registros: {len(df):,}
-Colunas: {len(df.columns)}
-
-=== TIPOS DE DADOS ===
-{df.dtypes.to_string()}
-
-=== COLUNAS NUMÉRICAS ===
-{', '.join(self.column_stats[self.current_file]['numeric_cols'])}
-
-=== COLUNAS DE TEXTO ===
-{', '.join(self.column_stats[self.current_file]['text_cols'])}
-
-=== ESTATÍSTICAS ===
-{df.describe().to_string()}
-"""
-            self.metadata_text.insert(tk.END, metadata)
+            self.metadata_text.insert(tk.END, self.column_stats[self.current_file]['metadata_text'])
             self.metadata_text.config(state=tk.DISABLED)
             
             # Atualiza visualização gráfica
@@ -375,31 +636,43 @@ Colunas: {len(df.columns)}
     
     def update_visualizations(self, df):
         """Atualiza os gráficos com os dados atuais"""
-        self.figure.clear()
+        self.ax1.cla()
+        self.ax2.cla()
         
         # Gráfico de valores (se existir coluna numérica)
         numeric_cols = self.column_stats[self.current_file]['numeric_cols']
+        self.ax1.set_visible(bool(numeric_cols))
         if numeric_cols:
-            ax1 = self.figure.add_subplot(211)
             try:
-                df[numeric_cols[0]].plot(kind='hist', ax=ax1, bins=20)
-                ax1.set_title(f'Distribuição de {numeric_cols[0]}')
-                ax1.grid(True)
+                values = df[numeric_cols[0]].dropna().to_numpy()
+                if len(values) > MAX_HIST_POINTS:
+                    values = np.random.default_rng(0).choice(values, MAX_HIST_POINTS, replace=False)
+                self.ax1.hist(values, bins=20)
+                self.ax1.set_title(f'Distribuição de {numeric_cols[0]}')
+                self.ax1.set_ylabel('Frequency')
+                self.ax1.grid(True)
             except:
                 pass
         
         # Gráfico de fornecedores (se existir)
+        self.ax2.set_visible('fornecedor' in df.columns)
         if 'fornecedor' in df.columns:
-            ax2 = self.figure.add_subplot(212)
             try:
                 top_suppliers = df['fornecedor'].value_counts().head(5)
-                top_suppliers.plot(kind='bar', ax=ax2)
-                ax2.set_title('Top 5 Fornecedores (Frequência)')
-                ax2.grid(True)
+                top_suppliers.plot(kind='bar', ax=self.ax2)
+                self.ax2.set_title('Top 5 Fornecedores (Frequência)')
+                self.ax2.grid(True)
             except:
                 pass
         
-        self.canvas.draw()
+        self.canvas.draw_idle()
+    
+    def clear_visualizations(self):
+        """Limpa os gráficos mantendo os eixos para reuso"""
+        for ax in (self.ax1, self.ax2):
+            ax.cla()
+            ax.set_visible(False)
+        self.canvas.draw_idle()
     
     def delete_file(self):
         """Remove arquivo selecionado"""
@@ -412,6 +685,8 @@ Colunas: {len(df.columns)}
         if filename in self.dataframes:
             if messagebox.askyesno("Confirmar", f"Remover arquivo {filename}?"):
                 del self.dataframes[filename]
+                self.column_stats.pop(filename, None)
+                self._invalidate_caches()
                 
                 if self.current_file == filename:
                     self.current_file = None
@@ -420,8 +695,7 @@ Colunas: {len(df.columns)}
                     self.metadata_text.config(state=tk.NORMAL)
                     self.metadata_text.delete(1.0, tk.END)
                     self.metadata_text.config(state=tk.DISABLED)
-                    self.figure.clear()
-                    self.canvas.draw()
+                    self.clear_visualizations()
                 
                 self.update_file_list()
                 self.add_message("Sistema", f"Arquivo removido: {filename}", 'system')
@@ -433,7 +707,7 @@ Colunas: {len(df.columns)}
             return
         
         try:
-            combined_df = pd.concat(self.dataframes.values(), ignore_index=True)
+            combined_df = self._get_combined()
             export_path = filedialog.asksaveasfilename(
                 defaultextension=".csv",
                 filetypes=[("CSV", "*.csv"), ("Excel", "*.xlsx"), ("Todos os arquivos", "*.*")],
@@ -456,6 +730,10 @@ Colunas: {len(df.columns)}
     def send_question(self):
         """Envia pergunta para análise"""
         question = self.user_input.get().strip()
+        if question and self._cancel_event is not None:
+            # Uma resposta por vez, para os trechos não se misturarem no chat
+            self.status_var.set("⏳ Aguarde a resposta atual ou cancele a consulta")
+            return
         if question:
             self.user_input.delete(0, tk.END)
             self.ask_question(question)
@@ -469,76 +747,123 @@ Colunas: {len(df.columns)}
         self.add_message("Você", question, 'user')
         
         # Verifica se é uma pergunta pré-definida
-        for q_text, q_content in self.predefined_questions.items():
-            if question.lower() == q_text.lower() or question.lower() == q_content.lower():
-                self.answer_predefined_question(q_text)
-                return
+        normalized = normalize_question(question)
+        q_text = self._question_index.get(normalized)
+        if q_text:
+            self.answer_predefined_question(q_text)
+            return
+        
+        # Mesma pergunta sobre os mesmos dados reaproveita a resposta da API
+        cache_key = ('api', self._dataset_version, normalized)
+        answer = self._answer_cache.get(cache_key)
+        if answer:
+            self.add_message("Agente", answer, 'agent')
+            return
         
         # Se não for pré-definida, usa API
+        cancel_event = threading.Event()
+        self._cancel_event = cancel_event
         threading.Thread(
             target=self.process_question_with_api,
-            args=(question,),
+            args=(question, cache_key, cancel_event),
             daemon=True
         ).start()
     
+    def run_analysis(self, analysis):
+        """Executa uma análise local e mostra o resultado no chat"""
+        answer = analysis()
+        if answer.startswith('❌'):
+            self.add_message("Erro", answer, 'error')
+        else:
+            self.add_message("Agente", answer, 'agent')
+    
     def answer_predefined_question(self, question_key):
         """Responde perguntas pré-definidas com análise local"""
         try:
-            if question_key == 'Maior Fornecedor':
-                answer = self.analyze_top_suppliers(1)
-            elif question_key == 'Total NFs':
-                answer = self.count_invoices()
-            elif question_key == 'Valor Médio':
-                answer = self.calculate_mean_value()
-            elif question_key == 'Top 3 Fornecedores':
-                answer = self.analyze_top_suppliers(3)
-            elif question_key == 'Distribuição Temporal':
-                answer = self.analyze_temporal_dist()
+            key = (self._dataset_version, question_key)
+            answer = self._answer_cache.get(key)
+            if answer is None:
+                if question_key == 'Maior Fornecedor':
+                    answer = self.analyze_top_suppliers(1)
+                elif question_key == 'Total NFs':
+                    answer = self.count_invoices()
+                elif question_key == 'Valor Médio':
+                    answer = self.calculate_mean_value()
+                elif question_key == 'Top 3 Fornecedores':
+                    answer = self.analyze_top_suppliers(3)
+                elif question_key == 'Distribuição Temporal':
+                    answer = self.analyze_temporal_dist()
+                
+                if not answer.startswith('❌'):
+                    self._answer_cache[key] = answer
             
             self.add_message("Agente", answer, 'agent')
         except Exception as e:
             self.add_message("Erro", f"Falha na análise: {str(e)}", 'error')
     
-    def process_question_with_api(self, question):
+    def process_question_with_api(self, question, cache_key=None, cancel_event=None):
         """Processa pergunta usando a API da OpenAI"""
         self.status_var.set("🔄 Consultando especialista...")
+        cancel_event = cancel_event or threading.Event()
+        parts = []
         
         try:
-            # Combina amostras de todos os dataframes
-            combined_sample = pd.concat(
-                [df.sample(min(1000, len(df))) for df in self.dataframes.values()]
-            )
-            
-            prompt = (
-                "Você é um especialista em notas fiscais brasileiras (NF-e). "
-                "Analise os dados e responda de forma técnica e precisa.\n\n"
-                f"Dados (amostra representativa):\n{combined_sample.to_string()}\n\n"
-                f"Pergunta: {question}\n\n"
-                "Inclua insights relevantes sobre:"
-                "\n- Relação entre fornecedores e valores"
-                "\n- Padrões temporais"
-                "\n- Anomalias potenciais"
-                "\n- Conformidade com legislação brasileira"
-            )
+            # Amostra limitada de todos os dataframes, em CSV
+            combined_sample = self._get_prompt_sample()
             
-            response = self.client.chat.completions.create(
+            # Conteúdo estável primeiro e pergunta por último
+            stream = self.get_client().chat.completions.create(
                 model="gpt-4-turbo",
                 messages=[
-                    {"role": "system", "content": "Você é um analista especialista em NF-e brasileiras."},
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": FIXED_INSTRUCTIONS},
+                    {"role": "user", "content": f"Dados (amostra representativa):\n{combined_sample}"},
+                    {"role": "user", "content": f"Pergunta: {question}"}
                 ],
                 max_tokens=1000,
-                temperature=0.2
+                temperature=0.2,
+                stream=True
             )
             
-            answer = response.choices[0].message.content
-            self.add_message("Agente", answer, 'agent')
+            # Exibe a resposta conforme os trechos chegam
+            timestamp = datetime.now().strftime("%H:%M:%S")
+            self.root.after(0, self._append_token, f"[{timestamp}] Agente:\n")
+            for chunk in stream:
+                if cancel_event.is_set():
+                    stream.close()
+                    self.root.after(0, self._append_token, "\n[consulta cancelada]")
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    self.root.after(0, self._append_token, chunk.choices[0].delta.content)
+            else:
+                # Só respostas completas e dos dados atuais entram no cache
+                if cache_key and parts and cache_key[1] == self._dataset_version:
+                    self._answer_cache[cache_key] = ''.join(parts)
+            self.root.after(0, self._append_token, "\n\n")
             
         except Exception as e:
-            self.add_message("Erro", f"Falha na consulta: {str(e)}", 'error')
+            self.root.after(0, self.add_message, "Erro", f"Falha na consulta: {str(e)}", 'error')
             logging.error(f"Erro na API: {str(e)}")
         finally:
-            self.status_var.set("🟢 Pronto")
+            self.root.after(0, self._on_question_done, cancel_event)
+    
+    def _on_question_done(self, cancel_event):
+        """Libera o envio de novas perguntas, já na thread da interface"""
+        if self._cancel_event is cancel_event:
+            self._cancel_event = None
+        self.status_var.set("🟢 Pronto")
+    
+    def cancel_question(self):
+        """Interrompe a resposta da API em andamento"""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+    
+    def _append_token(self, token, tag='agent'):
+        """Acrescenta um trecho da resposta ao chat"""
+        self.chat_area.config(state=tk.NORMAL)
+        self.chat_area.insert(tk.END, token, tag)
+        self.chat_area.config(state=tk.DISABLED)
+        self.chat_area.see(tk.END)
     
     def add_message(self, sender, message, tag=None):
         """Adiciona mensagem ao chat"""
@@ -552,12 +877,13 @@ Colunas: {len(df.columns)}
     def analyze_top_suppliers(self, top_n=3):
         """Analisa os maiores fornecedores"""
         try:
-            combined_df = pd.concat(self.dataframes.values(), ignore_index=True)
-            
-            if 'fornecedor' not in combined_df.columns or 'valor' not in combined_df.columns:
+            supplier_totals = self._get_supplier_totals()
+            if supplier_totals is None:
                 return "❌ Colunas 'fornecedor' ou 'valor' não encontradas nos dados"
             
-            result = combined_df.groupby('fornecedor')['valor'].sum().nlargest(top_n)
+            names, totals = supplier_totals
+            idx = top_k_indices(totals, top_n)
+            result = pd.Series(totals[idx], index=pd.Index(names[idx], name='fornecedor'), name='valor')
             return f"🔝 Top {top_n} fornecedores por valor total:\n\n{result.to_string()}"
         
         except Exception as e:
@@ -574,26 +900,37 @@ Colunas: {len(df.columns)}
     def calculate_mean_value(self):
         """Calcula o valor médio das notas"""
         try:
-            combined_df = pd.concat(self.dataframes.values(), ignore_index=True)
-            
-            if 'valor' not in combined_df.columns:
+            mean_val = weighted_mean(self.column_stats)
+            if mean_val is None:
                 return "❌ Coluna 'valor' não encontrada"
-            
-            mean_val = combined_df['valor'].mean()
             return f"💰 Valor médio das notas: R${mean_val:,.2f}"
         except Exception as e:
             return f"❌ Erro no cálculo: {str(e)}"
     
     def analyze_temporal_dist(self):
         """Analisa distribuição temporal"""
+        key = (self._dataset_version, 'analyze_temporal_dist')
+        if key not in self._answer_cache:
+            answer = self._compute_temporal_dist()
+            if answer.startswith('❌'):
+                return answer
+            self._answer_cache[key] = answer
+        return self._answer_cache[key]
+    
+    def _compute_temporal_dist(self):
+        """Calcula a distribuição temporal mensal"""
         try:
-            combined_df = pd.concat(self.dataframes.values(), ignore_index=True)
-            
-            if 'data' not in combined_df.columns:
+            # Por arquivo: colunas 'data' mantidas como texto são lidas agora
+            datas = [date_values(df['data']) for df in self.dataframes.values() if 'data' in df.columns]
+            if not datas:
                 return "❌ Coluna 'data' não encontrada"
             
-            combined_df['data'] = pd.to_datetime(combined_df['data'])
-            temporal = combined_df.resample('M', on='data').size()
+            datas = np.concatenate(datas)
+            datas = datas[~np.isnat(datas)]
+            if datas.size == 0:
+                return "❌ Nenhuma data válida nos dados"
+            
+            temporal = pd.DataFrame({'data': datas}).resample('MS', on='data').size()
             
             return f"📅 Distribuição temporal (mensal):\n\n{temporal.to_string()}"
         except Exception as e:
@@ -601,8 +938,18 @@ Colunas: {len(df.columns)}
     
     def show_stats(self):
         """Mostra estatísticas básicas"""
+        key = (self._dataset_version, 'show_stats')
+        if key not in self._answer_cache:
+            answer = self._compute_stats()
+            if answer.startswith('❌'):
+                return answer
+            self._answer_cache[key] = answer
+        return self._answer_cache[key]
+    
+    def _compute_stats(self):
+        """Calcula as estatísticas descritivas dos valores"""
         try:
-            combined_df = pd.concat(self.dataframes.values(), ignore_index=True)
+            combined_df = self._get_combined()
             
             if 'valor' not in combined_df.columns:
                 return "❌ Coluna 'valor' não encontrada"
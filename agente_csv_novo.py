@@ -1,15 +1,65 @@
 import pandas as pd
 import zipfile
 import os
+import io
+import hashlib
+import shelve
+import time
+import re
+import glob
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 import sys
+import asyncio
 from datetime import datetime
-import chardet
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import functools
+from contextlib import contextmanager
+from _kernels import grouped_sum, top_k_indices
+from _common import (
+    ARROW_TEXT_COLUMNS, USE_ARROW_DTYPES, date_values, is_money_column, normalize_question,
+    parse_date_column, weighted_mean
+)
+
+try:
+    import charset_normalizer
+except ImportError:  # detecção de codificação só é usada quando UTF-8 falha
+    charset_normalizer = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; sem ele usa-se o leitor do pandas
+    pa = None
+
+# CSVs dentro de ZIPs são lidos direto do arquivo, com buffer de 1 MiB
+READ_BUFFER_SIZE = 1 << 20
+
+# Respostas da API persistidas por pergunta normalizada e versão dos dados
+ANSWER_CACHE_PATH = os.path.join('.cache', 'answers.db')
+ANSWER_CACHE_TTL = 7 * 24 * 3600
+
+# Prefixo fixo do prompt; fica igual entre perguntas para aproveitar o cache do provedor
+SYSTEM_PROMPT = (
+    "Você é um analista especialista em notas fiscais brasileiras (NF-e). "
+    "Analise os dados e responda de forma técnica e precisa.\n"
+    "Inclua insights relevantes sobre:"
+    "\n- Relação entre fornecedores e valores"
+    "\n- Padrões temporais"
+    "\n- Anomalias potenciais"
+    "\n- Conformidade com legislação brasileira"
+)
+PROMPT_DESCRIBE_ROWS = 20
+PROMPT_TOP_SUPPLIERS = 10
+PROMPT_SAMPLE_ROWS = 50
+
+# Colunas de data convertidas para timestamp na carga
+DATE_COLUMNS = ('data', 'DATA EMISSÃO')
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
 
 # Configuração de logging
 logging.basicConfig(
@@ -25,25 +75,38 @@ class NFExpertSystem:
     def __init__(self):
         self.dataframes: Dict[str, pd.DataFrame] = {}
         self.current_file: Optional[str] = None
-        self.client: Optional[OpenAI] = None
+        self.client: Optional[AsyncOpenAI] = None
         self.column_stats: Dict[str, Dict] = {}
+        self._combined: Optional[pd.DataFrame] = None
+        self._dirty = True
+        self._answer_cache: Dict[str, str] = {}
+        self._static_prefix: Optional[Tuple[str, str]] = None
+        self.use_arrow_dtypes = USE_ARROW_DTYPES
         self.load_config()
         self.setup_analytics()
         
     def load_config(self) -> None:
-        """Carrega configurações do ambiente e inicializa cliente OpenAI"""
+        """Carrega configurações do ambiente"""
         try:
             load_dotenv()
             self.api_key = os.getenv("OPENAI_API_KEY")
             if not self.api_key:
                 raise ValueError("OPENAI_API_KEY não encontrada no .env")
-            self.client = OpenAI(api_key=self.api_key)
         except Exception as e:
             logging.error(f"Falha na configuração: {str(e)}")
             sys.exit(1)
 
+    def _get_client(self) -> AsyncOpenAI:
+        """Cria o cliente OpenAI apenas na primeira consulta à API"""
+        if self.client is None:
+            self.client = AsyncOpenAI(api_key=self.api_key)
+        return self.client
+
     def setup_analytics(self) -> None:
         """Inicializa estruturas para análise de dados"""
+        # Compila o kernel de agregação agora, e não na primeira pergunta
+        grouped_sum(np.zeros(2, dtype=np.int64), np.zeros(2), 1)
+        
         self.predefined_questions = {
             '1': {
                 'question': "Qual é o fornecedor com maior valor total nas notas fiscais?",
@@ -66,12 +129,19 @@ class NFExpertSystem:
                 'analysis': self._analyze_temporal_distribution
             }
         }
+        # Índice por pergunta normalizada para despacho direto
+        self._q_index = {
+            normalize_question(item['question']): item['analysis']
+            for item in self.predefined_questions.values()
+        }
 
-    def detect_encoding(self, file_path: str) -> str:
-        """Detecta a codificação do arquivo"""
-        with open(file_path, 'rb') as f:
-            result = chardet.detect(f.read(10000))
-        return result['encoding']
+    def detect_encoding(self, file_path: str, member: Optional[str] = None) -> Optional[str]:
+        """Detecta a codificação do arquivo (chamado apenas quando UTF-8 falha)"""
+        if charset_normalizer is None:
+            return None
+        with self._open_csv(file_path, member) as f:
+            best = charset_normalizer.from_fp(f).best()
+        return best.encoding if best else None
 
     def load_file(self, file_path: Optional[str] = None) -> bool:
         """Carrega arquivo ZIP ou CSV com tratamento robusto"""
@@ -83,21 +153,24 @@ class NFExpertSystem:
             return False
 
         try:
-            temp_dir = None
+            source = os.stat(file_path)
+            source_key = (os.path.abspath(file_path), source.st_mtime_ns, source.st_size)
+            member = None
             if file_path.endswith('.zip'):
-                temp_dir = self._extract_zip(file_path)
-                csv_files = [f for f in os.listdir(temp_dir) if f.endswith('.csv')]
-                if not csv_files:
+                with zipfile.ZipFile(file_path) as zf:
+                    member = next((n for n in zf.namelist() if n.endswith('.csv')), None)
+                if member is None:
                     logging.error("Nenhum CSV encontrado no ZIP")
                     return False
-                file_path = os.path.join(temp_dir, csv_files[0])
 
-            encoding = self.detect_encoding(file_path)
-            df = self._read_csv_with_fallback(file_path, encoding)
+            df = self._read_csv_with_fallback(file_path, member)
             
-            filename = os.path.basename(file_path)
+            filename = os.path.basename(member or file_path)
             self.dataframes[filename] = df
             self._update_column_stats(filename, df)
+            self.column_stats[filename]['original_dtypes'] = self._compact(df)
+            self.column_stats[filename]['source'] = source_key
+            self._dirty = True
             
             if not self.current_file:
                 self.current_file = filename
@@ -108,55 +181,170 @@ class NFExpertSystem:
         except Exception as e:
             logging.error(f"Erro ao carregar arquivo: {str(e)}")
             return False
-        finally:
-            if temp_dir and os.path.exists(temp_dir):
-                self._cleanup_temp_dir(temp_dir)
-
-    def _extract_zip(self, zip_path: str) -> str:
-        """Extrai arquivo ZIP para diretório temporário"""
-        extract_path = f"temp_extract_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        os.makedirs(extract_path, exist_ok=True)
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_path)
-        return extract_path
-
-    def _read_csv_with_fallback(self, file_path: str, encoding: str) -> pd.DataFrame:
+
+    @contextmanager
+    def _open_csv(self, file_path: str, member: Optional[str] = None):
+        """Abre o CSV em modo binário, direto de dentro do ZIP quando for o caso"""
+        if member is None:
+            with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+                yield f
+            return
+        with zipfile.ZipFile(file_path) as zf, zf.open(member) as raw:
+            yield io.BufferedReader(raw, buffer_size=READ_BUFFER_SIZE)
+
+    def _read_csv_with_fallback(self, file_path: str, member: Optional[str] = None) -> pd.DataFrame:
         """Tenta ler CSV com diferentes abordagens"""
+        if pa is not None:
+            try:
+                return self._read_csv_arrow(file_path, member)
+            except pa.ArrowInvalid as e:
+                logging.warning(f"Falha ao ler CSV com pyarrow, usando pandas: {str(e)}")
+        
+        # UTF-8 primeiro; detecção só quando a decodificação falha
         try:
-            return pd.read_csv(file_path, encoding=encoding, low_memory=False)
-        except Exception as e:
+            return self._read_csv_pandas(file_path, member, 'utf-8')
+        except UnicodeDecodeError:
+            encoding = self.detect_encoding(file_path, member) or 'latin-1'
+        try:
+            return self._read_csv_pandas(file_path, member, encoding)
+        except UnicodeDecodeError:
+            return self._read_csv_pandas(file_path, member, 'latin-1')
+
+    def _read_csv_pandas(self, file_path: str, member: Optional[str], encoding: str) -> pd.DataFrame:
+        """Lê CSV com pandas, descartando linhas malformadas se necessário"""
+        try:
+            with self._open_csv(file_path, member) as f:
+                return pd.read_csv(f, encoding=encoding, low_memory=False)
+        except pd.errors.ParserError as e:
             logging.warning(f"Falha ao ler CSV, tentando abordagem alternativa: {str(e)}")
-            return pd.read_csv(file_path, encoding=encoding, error_bad_lines=False)
+            with self._open_csv(file_path, member) as f:
+                return pd.read_csv(f, encoding=encoding, low_memory=False, on_bad_lines='skip')
+
+    def _read_csv_arrow(self, file_path: str, member: Optional[str] = None) -> pd.DataFrame:
+        """Lê CSV com pyarrow, reaproveitando cópia em Parquet se o arquivo não mudou"""
+        st = os.stat(file_path)
+        base = f"{file_path}.{os.path.basename(member)}" if member else file_path
+        cache_path = f"{base}.{st.st_mtime_ns}.{st.st_size}.parquet"
+        if os.path.exists(cache_path):
+            table = pq.read_table(cache_path)
+        else:
+            table = self._parse_csv_arrow(file_path, member, 'utf8')
+            # Bytes que não são UTF-8 válido viram colunas binárias; tenta Latin-1
+            if any(pa.types.is_binary(field.type) for field in table.schema):
+                table = self._parse_csv_arrow(file_path, member, 'latin1')
+            try:
+                # Grava em arquivo temporário para nunca deixar um cache incompleto
+                pq.write_table(table, cache_path + '.tmp')
+                os.replace(cache_path + '.tmp', cache_path)
+                self._remove_stale_sidecars(base, cache_path)
+            except OSError as e:
+                logging.warning(f"Não foi possível gravar cache Parquet: {str(e)}")
+        
+        return table.to_pandas(types_mapper=pd.ArrowDtype if self.use_arrow_dtypes else None)
+
+    def _remove_stale_sidecars(self, base: str, current: str) -> None:
+        """Apaga cópias Parquet de versões anteriores do mesmo arquivo"""
+        pattern = re.compile(re.escape(base) + r'\.\d+\.\d+\.parquet')
+        for path in glob.glob(f"{glob.escape(base)}.*.parquet"):
+            if path != current and pattern.fullmatch(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.warning(f"Não foi possível remover cache Parquet antigo: {str(e)}")
+
+    def _parse_csv_arrow(self, file_path: str, member: Optional[str], encoding: str) -> 'pa.Table':
+        """Executa o parser multithread do pyarrow"""
+        with self._open_csv(file_path, member) as f:
+            return pacsv.read_csv(
+                f,
+                read_options=pacsv.ReadOptions(encoding=encoding, block_size=32 << 20),
+                parse_options=pacsv.ParseOptions(delimiter=','),
+                convert_options=pacsv.ConvertOptions(
+                    column_types={col: pa.string() for col in ARROW_TEXT_COLUMNS},
+                    strings_can_be_null=True
+                )
+            )
 
-    def _cleanup_temp_dir(self, temp_dir: str) -> None:
-        """Remove diretório temporário"""
-        for f in os.listdir(temp_dir):
-            os.remove(os.path.join(temp_dir, f))
-        os.rmdir(temp_dir)
+    def _compact(self, df: pd.DataFrame) -> Dict[str, str]:
+        """Reduz tipos numéricos e converte textos repetitivos em categoria"""
+        original_dtypes = df.dtypes.astype(str).to_dict()
+        for col in df.select_dtypes(include='number').columns:
+            dtype = df[col].dtype
+            if not isinstance(dtype, np.dtype):
+                continue
+            if np.issubdtype(dtype, np.floating) and is_money_column(col):
+                continue
+            downcast = 'float' if np.issubdtype(dtype, np.floating) else 'integer'
+            df[col] = pd.to_numeric(df[col], downcast=downcast)
+        for col in df.select_dtypes(include='object').columns:
+            if df[col].nunique(dropna=False) < 0.5 * len(df):
+                df[col] = df[col].astype('category')
+        return original_dtypes
+
+    def _parse_dates(self, df: pd.DataFrame) -> None:
+        """Converte colunas de data em texto para timestamp uma única vez"""
+        for col in df.select_dtypes(include='object').columns:
+            # Colunas fora da lista só são candidatas se o primeiro valor parecer data ISO
+            if col not in DATE_COLUMNS:
+                sample = df[col].dropna()
+                if sample.empty or not DATE_PATTERN.match(str(sample.iloc[0])):
+                    continue
+            parsed = parse_date_column(df[col])
+            if parsed is not None:
+                df[col] = parsed
 
     def _update_column_stats(self, filename: str, df: pd.DataFrame) -> None:
         """Atualiza estatísticas das colunas para análise"""
+        self._parse_dates(df)
         self.column_stats[filename] = {
             'numeric_cols': df.select_dtypes(include=np.number).columns.tolist(),
             'text_cols': df.select_dtypes(include='object').columns.tolist(),
             'date_cols': df.select_dtypes(include='datetime').columns.tolist(),
             'shape': df.shape
         }
+        if 'valor' not in df.columns or not pd.api.types.is_numeric_dtype(df['valor']):
+            return
+        
+        # Totais por arquivo, combinados na consulta sem reprocessar as linhas
+        valores = df['valor'].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.column_stats[filename]['valor_sum'] = float(np.nansum(valores))
+        self.column_stats[filename]['valor_count'] = int(np.count_nonzero(~np.isnan(valores)))
+        if 'fornecedor' in df.columns:
+            codes, uniques = pd.factorize(df['fornecedor'], sort=False)
+            self.column_stats[filename]['supplier_sums'] = pd.Series(
+                grouped_sum(codes, valores, len(uniques)),
+                index=pd.Index(uniques, name='fornecedor'), name='valor'
+            )
 
     def _analyze_all_files(self) -> pd.DataFrame:
         """Combina todos os dataframes para análise completa"""
         if not self.dataframes:
             raise ValueError("Nenhum dado carregado")
-        return pd.concat(self.dataframes.values(), ignore_index=True)
+        if self._dirty or self._combined is None:
+            self._combined = pd.concat(self.dataframes.values(), ignore_index=True)
+            self._dirty = False
+        return self._combined
+
+    def _supplier_totals(self) -> Optional[pd.Series]:
+        """Combina os totais por fornecedor pré-calculados de cada arquivo"""
+        sums = [s['supplier_sums'] for s in self.column_stats.values() if 'supplier_sums' in s]
+        if not sums:
+            return None
+        return functools.reduce(lambda a, b: a.add(b, fill_value=0), sums)
 
     def _analyze_top_suppliers(self, top_n: int = 3) -> str:
         """Análise local dos maiores fornecedores"""
         try:
-            combined_df = self._analyze_all_files()
-            if 'fornecedor' not in combined_df.columns or 'valor' not in combined_df.columns:
+            if not self.dataframes:
+                raise ValueError("Nenhum dado carregado")
+            totals = self._supplier_totals()
+            if totals is None:
                 return "Colunas 'fornecedor' ou 'valor' não encontradas nos dados"
+            if totals.empty:
+                return "Nenhum fornecedor com valor nos dados"
             
-            result = combined_df.groupby('fornecedor')['valor'].sum().nlargest(top_n)
+            top_idx = top_k_indices(totals.to_numpy(dtype=np.float64), top_n)
+            result = totals.iloc[top_idx]
             return f"Top {top_n} fornecedores por valor total:\n{result.to_string()}"
         except Exception as e:
             return f"Erro na análise: {str(e)}"
@@ -172,11 +360,11 @@ class NFExpertSystem:
     def _calculate_mean_value(self) -> str:
         """Cálculo do valor médio"""
         try:
-            combined_df = self._analyze_all_files()
-            if 'valor' not in combined_df.columns:
+            if not self.dataframes:
+                raise ValueError("Nenhum dado carregado")
+            mean_val = weighted_mean(self.column_stats)
+            if mean_val is None:
                 return "Coluna 'valor' não encontrada"
-            
-            mean_val = combined_df['valor'].mean()
             return f"Valor médio das notas: R${mean_val:,.2f}"
         except Exception as e:
             return f"Erro no cálculo: {str(e)}"
@@ -184,64 +372,139 @@ class NFExpertSystem:
     def _analyze_temporal_distribution(self) -> str:
         """Análise de distribuição temporal"""
         try:
-            combined_df = self._analyze_all_files()
-            if 'data' not in combined_df.columns:
+            if not self.dataframes:
+                raise ValueError("Nenhum dado carregado")
+            datas = [date_values(df['data']) for df in self.dataframes.values() if 'data' in df.columns]
+            if not datas:
                 return "Coluna 'data' não encontrada"
             
-            combined_df['data'] = pd.to_datetime(combined_df['data'])
-            temporal = combined_df.resample('M', on='data').size()
+            # Datas em datetime64: basta truncar ao mês e contar
+            meses = np.concatenate(datas).astype('datetime64[M]')
+            meses = meses[~np.isnat(meses)]
+            if meses.size == 0:
+                return "Nenhuma data válida nos dados"
+            
+            unicos, contagens = np.unique(meses, return_counts=True)
+            periodo = np.arange(unicos[0], unicos[-1] + 1, dtype='datetime64[M]')
+            totais = np.zeros(len(periodo), dtype=np.int64)
+            totais[np.searchsorted(periodo, unicos)] = contagens
+            temporal = pd.Series(totais, index=pd.DatetimeIndex(periodo.astype('datetime64[ns]'), name='data'))
             return f"Distribuição temporal:\n{temporal.to_string()}"
         except Exception as e:
             return f"Erro na análise temporal: {str(e)}"
 
-    def ask_question(self, question: str) -> str:
+    def _fingerprint(self) -> str:
+        """Identifica o conjunto de arquivos carregados e suas versões"""
+        sources = sorted((name, stats.get('source')) for name, stats in self.column_stats.items())
+        return hashlib.sha1(repr(sources).encode('utf-8')).hexdigest()
+
+    def _cached_answer(self, key: str) -> Optional[str]:
+        """Busca resposta persistida ainda dentro do prazo de validade"""
+        if not os.path.isdir(os.path.dirname(ANSWER_CACHE_PATH)):
+            return None
+        try:
+            with shelve.open(ANSWER_CACHE_PATH) as db:
+                entry = db.get(key)
+        except Exception as e:
+            logging.warning(f"Cache de respostas indisponível: {str(e)}")
+            return None
+        if entry and time.time() - entry[0] < ANSWER_CACHE_TTL:
+            return entry[1]
+        return None
+
+    def _store_answer(self, key: str, answer: str) -> None:
+        """Persiste resposta da API no cache em disco"""
+        try:
+            os.makedirs(os.path.dirname(ANSWER_CACHE_PATH), exist_ok=True)
+            with shelve.open(ANSWER_CACHE_PATH) as db:
+                db[key] = (time.time(), answer)
+        except Exception as e:
+            logging.warning(f"Falha ao gravar cache de respostas: {str(e)}")
+
+    def _build_data_context(self) -> str:
+        """Resume os dados para o prompt: esquema, estatísticas e maiores fornecedores"""
+        combined_df = self._analyze_all_files()
+        parts = [
+            f"Registros: {len(combined_df):,}",
+            f"Esquema:\n{combined_df.dtypes.to_string()}",
+            "Estatísticas:\n"
+            f"{combined_df.describe(include='all').transpose().head(PROMPT_DESCRIBE_ROWS).to_string()}"
+        ]
+        totals = self._supplier_totals()
+        if totals is not None and not totals.empty:
+            top_idx = top_k_indices(totals.to_numpy(dtype=np.float64), PROMPT_TOP_SUPPLIERS)
+            parts.append(f"Maiores fornecedores por valor total:\n{totals.iloc[top_idx].to_string()}")
+        
+        # Amostra pequena e fixa, em JSON lines (mais compacto que to_string)
+        sample = combined_df.sample(n=min(PROMPT_SAMPLE_ROWS, len(combined_df)), random_state=0)
+        parts.append(
+            "Amostra de registros (JSON lines):\n"
+            f"{sample.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')}"
+        )
+        return "\n\n".join(parts)
+
+    def _get_static_prefix(self, fingerprint: str) -> str:
+        """Instruções e resumo dos dados, refeitos só quando os arquivos mudam"""
+        if self._static_prefix is None or self._static_prefix[0] != fingerprint:
+            self._static_prefix = (fingerprint, f"{SYSTEM_PROMPT}\n\n{self._build_data_context()}")
+        return self._static_prefix[1]
+
+    async def ask_question(self, question: str) -> str:
         """Processa perguntas com análise local e consulta à API"""
         if not self.dataframes:
             return "❌ Erro: Nenhum dado carregado"
         
         # Tenta responder localmente primeiro
-        if question.lower() in [q['question'].lower() for q in self.predefined_questions.values()]:
-            for q in self.predefined_questions.values():
-                if q['question'].lower() == question.lower():
-                    try:
-                        return q['analysis']()
-                    except Exception as e:
-                        logging.error(f"Erro na análise local: {str(e)}")
-                        break
+        normalized = normalize_question(question)
+        analysis = self._q_index.get(normalized)
+        if analysis:
+            try:
+                # Análise local em thread para não travar as chamadas à API em andamento
+                return await asyncio.to_thread(analysis)
+            except Exception as e:
+                logging.error(f"Erro na análise local: {str(e)}")
+        
+        # Respostas anteriores para os mesmos dados dispensam a API
+        fingerprint = self._fingerprint()
+        cache_key = f"{fingerprint}:{normalized}"
+        answer = self._answer_cache.get(cache_key) or self._cached_answer(cache_key)
+        if answer:
+            self._answer_cache[cache_key] = answer
+            return answer
         
         # Se não for pergunta pré-definida ou falhar, usa API
         try:
-            combined_sample = pd.concat(
-                [df.sample(min(1000, len(df))) for df in self.dataframes.values()]
-            ).to_string()
-            
-            prompt = (
-                "Você é um especialista em notas fiscais brasileiras (NF-e). "
-                "Analise os dados e responda de forma técnica e precisa.\n\n"
-                f"Dados (amostra representativa):\n{combined_sample}\n\n"
-                f"Pergunta: {question}\n\n"
-                "Inclua insights relevantes sobre:"
-                "\n- Relação entre fornecedores e valores"
-                "\n- Padrões temporais"
-                "\n- Anomalias potenciais"
-                "\n- Conformidade com legislação brasileira"
-            )
+            static_prefix = await asyncio.to_thread(self._get_static_prefix, fingerprint)
             
-            response = self.client.chat.completions.create(
+            # Prefixo idêntico entre perguntas e só a pergunta ao final
+            response = await self._get_client().chat.completions.create(
                 model="gpt-4-turbo",
                 messages=[
-                    {"role": "system", "content": "Você é um analista especialista em NF-e brasileiras."},
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": static_prefix},
+                    {"role": "user", "content": f"Pergunta: {question}"}
                 ],
                 max_tokens=1000,
-                temperature=0.2
+                temperature=0.2,
+                user=fingerprint
             )
-            return response.choices[0].message.content.strip()
+            answer = response.choices[0].message.content.strip()
         except Exception as e:
             return f"❌ Erro na API: {str(e)}"
+        
+        self._answer_cache[cache_key] = answer
+        self._store_answer(cache_key, answer)
+        return answer
+
+    async def ask_many(self, questions: List[str]) -> List[str]:
+        """Processa várias perguntas em paralelo"""
+        return await asyncio.gather(*[self.ask_question(q) for q in questions])
 
     def interactive_menu(self) -> None:
         """Menu interativo para o usuário"""
+        asyncio.run(self._menu_loop())
+
+    async def _menu_loop(self) -> None:
+        """Laço do menu principal"""
         while True:
             print("\n" + "="*60)
             print("SISTEMA ESPECIALISTA EM NOTAS FISCAIS - GRUPO 281".center(60))
@@ -269,9 +532,9 @@ class NFExpertSystem:
             elif choice == '3':
                 self._show_metadata()
             elif choice == '4':
-                self._predefined_questions_menu()
+                await self._predefined_questions_menu()
             elif choice == '5':
-                self._custom_question()
+                await self._custom_question()
             elif choice == '6':
                 self._export_analysis()
             elif choice == '7':
@@ -285,6 +548,8 @@ class NFExpertSystem:
         filename = input("🗑️ Nome do arquivo a remover: ").strip()
         if filename in self.dataframes:
             del self.dataframes[filename]
+            self.column_stats.pop(filename, None)
+            self._dirty = True
             if self.current_file == filename:
                 self.current_file = next(iter(self.dataframes.keys()), None)
             print(f"✅ Arquivo {filename} removido")
@@ -305,24 +570,30 @@ class NFExpertSystem:
             print("  Tipos de dados:")
             print(df.dtypes.to_string())
 
-    def _predefined_questions_menu(self) -> None:
+    async def _predefined_questions_menu(self) -> None:
         """Menu de perguntas pré-definidas"""
         print("\n📊 PERGUNTAS PRÉ-DEFINIDAS:")
         for key, item in self.predefined_questions.items():
             print(f"{key}. {item['question']}")
+        print("T. Responder todas")
         
         sub_choice = input("👉 Selecione uma pergunta: ").strip()
         if sub_choice in self.predefined_questions:
-            answer = self.ask_question(self.predefined_questions[sub_choice]['question'])
+            answer = await self.ask_question(self.predefined_questions[sub_choice]['question'])
             print(f"\n💡 RESPOSTA:\n{answer}\n")
+        elif sub_choice.upper() == 'T':
+            questions = [item['question'] for item in self.predefined_questions.values()]
+            answers = await self.ask_many(questions)
+            for question, answer in zip(questions, answers):
+                print(f"\n❓ {question}\n💡 RESPOSTA:\n{answer}\n")
         else:
             print("❌ Opção inválida")
 
-    def _custom_question(self) -> None:
+    async def _custom_question(self) -> None:
         """Interface para perguntas personalizadas"""
         question = input("💬 Digite sua pergunta: ").strip()
         if question:
-            answer = self.ask_question(question)
+            answer = await self.ask_question(question)
             print(f"\n💡 RESPOSTA:\n{answer}\n")
 
     def _export_analysis(self) -> None: